@@ -7,6 +7,10 @@ Copyright © 2019 Steven Johnson
 from .defs import defs
 
 import os
+import copy
+import json
+import hashlib
+import tempfile
 import appdirs
 import tomlkit
 import inspect
@@ -80,35 +84,160 @@ class KiBlastConfig:
         CFG_NAME
     )
 
+    # Where the resolved configuration is cached between runs.
+    CACHE_FILE = os.path.join(
+        appdirs.user_cache_dir(defs.APPNAME, defs.APPAUTHOR),
+        defs.appname() + "_cfg_cache.json",
+    )
+
+    # Resolved configurations already seen by this process, keyed by _cache_key().
+    __resolved = {}
+
     def __init__(self, default_only=False):
         # Initialise the configurations
+        # Normal commands only need plain values, so resolve them from the cache
+        # when none of the config files have changed.  The tomlkit documents
+        # are only built when they are dumped.
+        self.__default_only = default_only
+
+        if default_only:
+            self.__values, self.__sources = self._plain_config(
+                self._resolve_toml(default_only=True)
+            )
+        else:
+            self.__values, self.__sources = self._cached_config()
+
+    @classmethod
+    def _cache_key(cls):
+        # Anything which changes the resolved configuration must change the key.
+        # That is the defaults and the modification time and size of each config file.
+        key = [
+            defs.SHORTVERSION,
+            hashlib.sha1(cls.DEFAULT_CFG.encode("utf-8")).hexdigest(),
+        ]
+        for cfg_file_name in cls.CFG_NAMES:
+            try:
+                stat = os.stat(cfg_file_name[0])
+                key.append([cfg_file_name[0], stat.st_mtime_ns, stat.st_size])
+            except OSError:
+                key.append([cfg_file_name[0], None, None])
+        return json.dumps(key)
+
+    @classmethod
+    def _cached_config(cls):
+        # Get the resolved values and sources, re-parsing the config files only if
+        # the in process and on disk caches are both stale.
+        key = cls._cache_key()
+
+        if key in cls.__resolved:
+            return cls.__resolved[key]
+
+        resolved = None
+        try:
+            with open(cls.CACHE_FILE) as f:
+                cached = json.load(f)
+            if cached["key"] == key:
+                resolved = (cached["values"], cached["sources"])
+        except (IOError, ValueError, KeyError, TypeError):
+            pass
+
+        if resolved is None:
+            resolved = cls._plain_config(cls._resolve_toml())
+            cls._write_cache(key, resolved)
+
+        cls.__resolved[key] = resolved
+        return resolved
+
+    @classmethod
+    def _write_cache(cls, key, resolved):
+        # The cache holds secrets such as the octopart apikey, so only the user
+        # may read it.  It is written to a temporary file and then renamed, so
+        # a command running at the same time never reads half a cache.
+        cache_dir = os.path.dirname(cls.CACHE_FILE)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, temp_name = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        except OSError:
+            return  # Not being able to cache is not fatal, we just resolve again.
+
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(
+                    {"key": key, "values": resolved[0], "sources": resolved[1]}, f
+                )
+            os.chmod(temp_name, 0o600)
+            os.replace(temp_name, cls.CACHE_FILE)
+        except (OSError, TypeError, ValueError):
+            try:
+                os.remove(temp_name)
+            except OSError:
+                pass
+
+    @classmethod
+    def _resolve_toml(cls, default_only=False):
+        # Parse the defaults and config files into a single tomlkit document,
+        # with each item commented with where its value came from.
 
         # Read the defaults first.
-        self.__cfg = tomlkit.parse(inspect.cleandoc(self.DEFAULT_CFG))
+        cfg_doc = tomlkit.parse(inspect.cleandoc(cls.DEFAULT_CFG))
+
+        if default_only:
+            return cfg_doc
 
         cfg_files = []
-        for cfg_file_name in self.CFG_NAMES:
+        for cfg_file_name in cls.CFG_NAMES:
             try:
                 with open(cfg_file_name[0]) as f:
                     cfg_files.append((tomlkit.parse(f.read()), cfg_file_name[1]))
             except IOError:
                 cfg_files.append(None)
 
-        if not default_only:
-            for group in self.__cfg.keys():
-                if group != "title":
-                    for item in self.__cfg[group]:
-                        # Add Default comment to ALL entries.
-                        self.__cfg[group][item].comment("DEFAULT")
-
-                        # Find config in files, in reverse order of importance.
-                        for cfg in reversed(cfg_files):
-                            if cfg is not None:
-                                # If the file updates the cfg item, set its new value
-                                # and update the comment to say where it came from.
-                                if (group in cfg[0]) and (item in cfg[0][group]):
-                                    self.__cfg[group][item] = cfg[0][group][item]
-                                    self.__cfg[group][item].comment(cfg[1])
+        for group in cfg_doc.keys():
+            if group != "title":
+                for item in cfg_doc[group]:
+                    # Add Default comment to ALL entries.
+                    cfg_doc[group][item].comment("DEFAULT")
+
+                    # Find config in files, in reverse order of importance.
+                    for cfg in reversed(cfg_files):
+                        if cfg is not None:
+                            # If the file updates the cfg item, set its new value
+                            # and update the comment to say where it came from.
+                            if (group in cfg[0]) and (item in cfg[0][group]):
+                                cfg_doc[group][item] = cfg[0][group][item]
+                                cfg_doc[group][item].comment(cfg[1])
+        return cfg_doc
+
+    @classmethod
+    def _plain_config(cls, cfg_doc):
+        # Convert a resolved tomlkit document into plain python values,
+        # and a matching dict of where each value came from.
+        values = {}
+        sources = {}
+        for group in cfg_doc.keys():
+            if group != "title":
+                values[group] = {}
+                sources[group] = {}
+                for item in cfg_doc[group]:
+                    values[group][item] = cls._plain_value(cfg_doc[group][item])
+                    comment = cfg_doc[group][item].trivia.comment
+                    sources[group][item] = comment.lstrip("# ") or "DEFAULT"
+        return values, sources
+
+    @classmethod
+    def _plain_value(cls, item):
+        # tomlkit items wrap the python types, unwrap them so they can be cached.
+        value = getattr(item, "value", item)
+        if isinstance(value, dict):
+            return {key: cls._plain_value(value[key]) for key in value}
+        if isinstance(value, list):
+            return [cls._plain_value(entry) for entry in value]
+        if isinstance(value, bool):
+            return value
+        for plain_type in (int, float, str):
+            if isinstance(value, plain_type):
+                return plain_type(value)
+        return value
 
     def dump(self, color=0):
         if color == 0:
@@ -118,8 +247,18 @@ class KiBlastConfig:
         else:
             formatter = NullFormatter()
 
-        print(pygments.highlight(tomlkit.dumps(self.__cfg), TOMLLexer(), formatter))
+        cfg_doc = self._resolve_toml(default_only=self.__default_only)
+        print(pygments.highlight(tomlkit.dumps(cfg_doc), TOMLLexer(), formatter))
 
     def get(self, group, item):
         # Get the configuration
-        return self.__cfg[group][item]
+        # The resolved values are shared by every KiBlastConfig, so hand out a copy.
+        return copy.deepcopy(self.__values[group][item])
+
+    def values(self):
+        # Get all of the resolved configuration, as {group: {item: value}}
+        return copy.deepcopy(self.__values)
+
+    def source(self, group, item):
+        # Get where the configuration came from, "DEFAULT", "LOCAL", "USER" or "SYSTEM"
+        return self.__sources[group][item]
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""KiBlast BOM Costing
+
+SPDX-License-Identifier: GPL-3.0-or-later
+Copyright © 2019 Steven Johnson
+"""
+from collections import namedtuple
+import csv
+import sys
+
+# A single what-if costing of the BOM.
+#   stock       : Parts in local stock may be used.
+#   octopart    : Parts may be costed from the Octopart cache.
+#   distributor : If not None, offers from configured distributors are limited to
+#                 this one.  A price file is from a distributor when its SOURCE
+#                 names it, eg. digikey.price.csv is from "Digi-Key".
+#   qty         : Number of boards being built.
+Scenario = namedtuple("Scenario", ["stock", "octopart", "distributor", "qty"])
+
+
+class BomCosting:
+    # Resolves the BOM lines, and every stock and price offer that can fill them, once.
+    # Any number of Scenarios can then be costed against the resolved offers.
+
+    def __init__(self, eexml, data, variant="COMMON", distributors=()):
+        self.__data = data
+        self.__variant = variant
+        self.__distributors = {
+            self._distributor_key(distributor): distributor
+            for distributor in distributors
+        }
+
+        self.lines = self._resolve_lines(eexml)
+        self.__stock_offers = []
+        self.__price_offers = []
+        for line in self.lines:
+            candidates = self._candidates(line)
+            self.__stock_offers.append(self._stock_offers(candidates))
+            self.__price_offers.append(self._price_offers(candidates))
+
+    def _resolve_lines(self, eexml):
+        # Group the fitted parts of the variant by MFG/MPN.
+        # Each line is {"MFG":..., "MPN":..., "EQUIVOK":..., "REFS":[...]}
+        lines = {}
+
+        def add_part(ref, part):
+            if not part["FITTED"]:
+                return
+            key = (part["MFG"], part["MPN"])
+            if key not in lines:
+                lines[key] = {
+                    "MFG": part["MFG"],
+                    "MPN": part["MPN"],
+                    "EQUIVOK": part["EQUIVOK"],
+                    "REFS": [],
+                }
+            # Equivalents can only be used if every ref allows it.
+            lines[key]["EQUIVOK"] = lines[key]["EQUIVOK"] and part["EQUIVOK"]
+            lines[key]["REFS"].append(ref)
+
+        known_refs = []
+        for ref in eexml.get_all_refs():
+            known_refs.append(ref)
+            for comp in eexml.get_component(ref):
+                parts = comp["PARTS"]
+                add_part(ref, parts.get(self.__variant, parts["COMMON"]))
+
+        for part in self.__data.extras.getParts(self.__variant, known_refs):
+            add_part(part["REF"], part)
+
+        return list(lines.values())
+
+    def _candidates(self, line):
+        # The part itself, followed by its equivalents if they may be used.
+        candidates = [(line["MFG"], line["MPN"])]
+        if line["EQUIVOK"]:
+            equivalents = self.__data.equivalents.getCatalog()
+            for index in equivalents.lookup(("MFG", "MPN"), candidates[0]):
+                extra = self._split_extra(equivalents.value(index, "EXTRA"))
+                for mfg, mpn in zip(extra[0::2], extra[1::2]):
+                    if (mfg, mpn) not in candidates:
+                        candidates.append((mfg, mpn))
+        return candidates
+
+    def _stock_offers(self, candidates):
+        # Get (stock index, MFG, MPN, unit cost, qty on hand) for each candidate
+        # held in stock.  The stock index identifies the stock item, which more
+        # than one line can draw from.
+        offers = []
+        stock = self.__data.stock.getCatalog()
+        for candidate in candidates:
+            for index in stock.lookup(("MFG", "MPN"), candidate):
+                on_hand = self._to_number(stock.value(index, "QTY_ON_HAND"))
+                cost = self._to_number(stock.value(index, "COST"))
+                cost_qty = self._to_number(stock.value(index, "COST_QTY")) or 1
+                if on_hand and (on_hand > 0):
+                    unit_cost = 0.0 if cost is None else cost / cost_qty
+                    offers.append(
+                        (index, candidate[0], candidate[1], unit_cost, int(on_hand))
+                    )
+        return offers
+
+    def _price_offers(self, candidates):
+        # Get (MFG, MPN, SOURCE, DISTRIBUTOR, is octopart, [(MOQ, PRICE), ...])
+        # for each candidate.
+        # DISTRIBUTOR is the configured distributor the SOURCE names, or None.
+        # Price breaks are sorted by MOQ.
+        # These all come from the local price files.  Only the Octopart cache
+        # gives octopart offers, and PartCache holds none yet.
+        offers = []
+        pricings = self.__data.pricings.getCatalog()
+        for candidate in candidates:
+            for index in pricings.lookup(("MFG", "MPN"), candidate):
+                extra = self._split_extra(pricings.value(index, "EXTRA"))
+                breaks = []
+                for moq, price in zip(extra[0::2], extra[1::2]):
+                    moq = self._to_number(moq)
+                    price = self._to_number(price)
+                    if (moq is not None) and (price is not None):
+                        breaks.append((int(moq), price))
+                if len(breaks) > 0:
+                    source = pricings.value(index, "SOURCE")
+                    offers.append(
+                        (
+                            candidate[0],
+                            candidate[1],
+                            source,
+                            self.__distributors.get(self._distributor_key(source)),
+                            False,
+                            sorted(breaks),
+                        )
+                    )
+        return offers
+
+    @staticmethod
+    def _distributor_key(name):
+        # So "Digi-Key" in the config matches the source of digikey.price.csv
+        return "".join(char for char in str(name).lower() if char.isalnum())
+
+    def has_stock(self):
+        # True if any line could be filled from stock.
+        return any(len(offers) > 0 for offers in self.__stock_offers)
+
+    def has_octopart(self):
+        # True if any line could be costed from the Octopart cache.
+        return any(offer[4] for offers in self.__price_offers for offer in offers)
+
+    def offered_distributors(self):
+        # The configured distributors which price at least one line, in config order.
+        offered = set(offer[3] for offers in self.__price_offers for offer in offers)
+        return [
+            distributor
+            for distributor in self.__distributors.values()
+            if distributor in offered
+        ]
+
+    @staticmethod
+    def _split_extra(extra):
+        # EXTRA holds the trailing columns of a data file, joined by ", "
+        if extra is None or extra == "":
+            return []
+        return [field.strip() for field in extra.split(",")]
+
+    @staticmethod
+    def _to_number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _buy_cost(breaks, qty):
+        # Cheapest way to buy at least qty from an offer.
+        # Returns (cost, (MOQ, PRICE) of the break used, qty bought).
+        # Below a break's MOQ, the MOQ must be bought, which can still be
+        # cheaper than buying just qty at a lower break.
+        best = None
+        for moq, price in breaks:
+            buy_qty = max(qty, moq)
+            cost = buy_qty * price
+            if (best is None) or (cost < best[0]):
+                best = (cost, (moq, price), buy_qty)
+        return best
+
+    def _allowed_offers(self, line_index, octopart, distributor):
+        # The price offers for a line which may be used, see Scenario.
+        offers = []
+        for offer in self.__price_offers[line_index]:
+            if offer[4] and not octopart:
+                continue
+            if (offer[3] is not None) and (distributor not in [None, offer[3]]):
+                continue
+            offers.append(offer)
+        return offers
+
+    def _cost_line(self, line_index, use_stock, offers, qty, remaining):
+        # Cost a single line of the BOM from the allowed price offers.
+        # remaining is {stock index: qty left on hand} for the lines costed so
+        # far, stock used by this line is taken from it.
+        choice = {
+            "LINE": line_index,
+            "QTY": qty,
+            "STOCK": [],
+            "MFG": None,
+            "MPN": None,
+            "SOURCE": None,
+            "BREAK": None,
+            "BUY_QTY": 0,
+            "COST": 0.0,
+            "SHORT": 0,
+        }
+
+        needed = qty
+        if use_stock:
+            for index, mfg, mpn, unit_cost, on_hand in self.__stock_offers[line_index]:
+                if needed <= 0:
+                    break
+                used = min(needed, remaining.get(index, on_hand))
+                if used <= 0:
+                    continue
+                remaining[index] = remaining.get(index, on_hand) - used
+                choice["STOCK"].append((mfg, mpn, used, unit_cost))
+                choice["COST"] += used * unit_cost
+                needed -= used
+
+        if needed > 0:
+            best = None
+            for mfg, mpn, source, distributor, octopart, breaks in offers:
+                cost, price_break, buy_qty = self._buy_cost(breaks, needed)
+                if (best is None) or (cost < best[0]):
+                    best = (cost, mfg, mpn, source, price_break, buy_qty)
+
+            if best is None:
+                # Can't be bought, so only the stock used is costed.
+                choice["SHORT"] = needed
+            else:
+                choice["MFG"], choice["MPN"], choice["SOURCE"] = best[1:4]
+                choice["BREAK"] = best[4]
+                choice["BUY_QTY"] = best[5]
+                choice["COST"] += best[0]
+
+        return choice
+
+    def cost_group(self, stock, octopart, distributor, quantities):
+        # Cost every line of the BOM at each quantity, for the scenarios which
+        # only differ by quantity.  The offers for a line are filtered once,
+        # then every quantity is costed from them.
+        # Returns {qty: (choice made for each line, total cost)}
+        # Parts which could not be bought (SHORT) are not in the total.
+        # Stock used by one line is not available to the lines after it.
+        results = {qty: ([], 0.0) for qty in quantities}
+        remaining = {qty: {} for qty in quantities}
+        for line_index, line in enumerate(self.lines):
+            offers = self._allowed_offers(line_index, octopart, distributor)
+            for qty in quantities:
+                choice = self._cost_line(
+                    line_index, stock, offers, len(line["REFS"]) * qty, remaining[qty]
+                )
+                choices, total = results[qty]
+                choices.append(choice)
+                results[qty] = (choices, total + choice["COST"])
+        return results
+
+    def cost(self, scenario):
+        # Cost every line of the BOM for the scenario.
+        # Returns the choice made for each line, and the total cost.
+        return self.cost_group(
+            scenario.stock, scenario.octopart, scenario.distributor, [scenario.qty]
+        )[scenario.qty]
+
+    def sweep(self, scenarios):
+        # Cost each scenario, every quantity of a stock/octopart/distributor
+        # combination is costed together.
+        # Returns {scenario: (total cost, number of lines not costed)}
+        groups = {}
+        for scenario in scenarios:
+            groups.setdefault(scenario[:3], []).append(scenario.qty)
+
+        costs = {}
+        for (stock, octopart, distributor), quantities in groups.items():
+            group = self.cost_group(stock, octopart, distributor, quantities)
+            for qty, (choices, total) in group.items():
+                uncosted = len([choice for choice in choices if choice["SHORT"] > 0])
+                costs[Scenario(stock, octopart, distributor, qty)] = (total, uncosted)
+
+        return {scenario: costs[scenario] for scenario in scenarios}
+
+
+def sweep_scenarios(costing, quantities, nostock=False, nooctopart=False):
+    # Every combination of stock, Octopart and distributor, at each quantity.
+    # nostock and nooctopart remove the scenarios which would use them.
+    # Combinations which can't change the cost of the BOM are left out.
+    stocks = [True, False]
+    if nostock or not costing.has_stock():
+        stocks = [False]
+
+    octoparts = [True, False]
+    if nooctopart or not costing.has_octopart():
+        octoparts = [False]
+
+    # With a single distributor, limiting to it is the same as all of them.
+    distributors = [None]
+    if len(costing.offered_distributors()) > 1:
+        distributors.extend(costing.offered_distributors())
+
+    scenarios = []
+    for stock in stocks:
+        for octopart in octoparts:
+            for distributor in distributors:
+                for qty in quantities:
+                    scenarios.append(Scenario(stock, octopart, distributor, qty))
+    return scenarios
+
+
+def dump_sweep(results, outfile=sys.stdout):
+    # Write the sweep results as a csv matrix.
+    # One row per stock/octopart/distributor combination, one column per quantity.
+    quantities = sorted(set(scenario.qty for scenario in results))
+    rows = {}
+    for scenario, (total, uncosted) in results.items():
+        label = (
+            "STOCK" if scenario.stock else "NO STOCK",
+            "OCTOPART" if scenario.octopart else "NO OCTOPART",
+            scenario.distributor or "ALL DISTRIBUTORS",
+        )
+        rows.setdefault(label, {})[scenario.qty] = (total, uncosted)
+
+    dumper = csv.writer(outfile, dialect="excel", escapechar="\\")
+    dumper.writerow(
+        ["STOCK", "OCTOPART", "DISTRIBUTOR"]
+        + ["QTY {}".format(qty) for qty in quantities]
+    )
+    for label, costs in rows.items():
+        row_data = list(label)
+        for qty in quantities:
+            total, uncosted = costs[qty]
+            if uncosted > 0:
+                row_data.append("{:.2f} ({} not costed)".format(total, uncosted))
+            else:
+                row_data.append("{:.2f}".format(total))
+        dumper.writerow(row_data)
@@ -9,6 +9,7 @@ import sys
 import appdirs
 from .defs import defs
 import csv
+from array import array
 
 
 class DataTableFile:
@@ -30,20 +31,29 @@ class DataTableFile:
 
         # Initialise Instance Variables
         self.__data = []
+        self.__catalog = None
 
-        data_files = []
-        for path in self.__DATA_DIRS:
-            if os.path.isdir(path):
-                with os.scandir(path) as entries:
-                    for datafile in sorted(entries, key=lambda file: file.name):
-                        if self._chk_loadable(datafile, self.__BASENAME):
-                            data_files.append(os.path.join(path, datafile))
+        data_files = self.findDataFiles(self.__BASENAME)
+        self.__files = data_files
 
         priority = 0
         for data in data_files:
             self._load_data(data, self.__DEFAULTS, priority)
             priority += 1
 
+    @classmethod
+    def findDataFiles(cls, basename):
+        # List the data files which match the base name, in priority order.
+        # This only lists the data directories, nothing is read.
+        data_files = []
+        for path in cls.__DATA_DIRS:
+            if os.path.isdir(path):
+                with os.scandir(path) as entries:
+                    for datafile in sorted(entries, key=lambda file: file.name):
+                        if cls._chk_loadable(datafile, basename):
+                            data_files.append(os.path.join(path, datafile))
+        return data_files
+
     @staticmethod
     def _chk_loadable(data_file, base_name):
         if data_file.is_dir():
@@ -115,8 +125,9 @@ class DataTableFile:
                 skipinitialspace=True,
                 escapechar="\\",
             )
+            first_column = list(defaults.keys())[0]
             for row in datareader:
-                if row["REF"].startswith("#"):
+                if (row[first_column] or "").startswith("#"):
                     continue  # This is a comment line, so ignore it.
 
                 if isRowHeader(row):
@@ -129,6 +140,7 @@ class DataTableFile:
         pass
 
     def dumpAllData(self):
+        self.getAllData()  # Makes the rows, if the table came from a catalog.
         if len(self.__data) > 0:
             # csv writer, which dumps to the terminal
             dumper = csv.writer(sys.stdout, dialect="excel", escapechar="\\")
@@ -145,8 +157,39 @@ class DataTableFile:
             print("No Data")
 
     def getAllData(self):
+        if self.__data is None:
+            # Attached to a catalog, so make the rows only when they are needed.
+            self.__data = self.__catalog.rows()
         return self.__data
 
+    @classmethod
+    def fromCatalog(cls, catalog):
+        # Make the data table from a catalog, instead of reading the data files.
+        table = cls.__new__(cls)
+        table.__BASENAME = None
+        table.__DEFAULTS = catalog.defaults()
+        table.__data = None
+        table.__catalog = catalog
+        table.__files = []
+        return table
+
+    def getCatalog(self):
+        # Get the data as a column store, built the first time it is needed.
+        if self.__catalog is None:
+            self.__catalog = PartCatalog(self.__data, self.__DEFAULTS)
+        return self.__catalog
+
+    def getDefaults(self):
+        return self.__DEFAULTS
+
+    def getBasename(self):
+        # None if the table was made from a catalog.
+        return self.__BASENAME
+
+    def getDataFiles(self):
+        # The data files which were read, in priority order.
+        return self.__files
+
     @staticmethod
     def dataToBool(
         value,
@@ -165,6 +208,159 @@ class DataTableFile:
         return str(value).upper() in truthTable
 
 
+class PartCatalog:
+    # Column store of the rows read from a DataTableFile.
+    # Columns which repeat the same few strings are dictionary encoded,
+    # each row holds an index into the list of distinct strings for the column.
+    # Bool columns and the PRIORITY column are held in typed arrays.
+    ENCODED_COLUMNS = ["MFG", "MPN", "SOURCE", "VARIANT"]
+
+    def __init__(self, rows, defaults):
+        self.__length = len(rows)
+        self.__defaults = defaults
+        self.__columns = {}
+        self.__strings = {}
+        self.__codes = {}
+        self.__bools = set()
+        self.__indexes = {}
+
+        if len(rows) > 0:
+            column_names = list(rows[0].keys())
+        else:
+            column_names = list(defaults.keys()) + ["EXTRA", "PRIORITY", "SOURCE"]
+
+        for column in column_names:
+            values = [row[column] for row in rows]
+            if column in self.ENCODED_COLUMNS:
+                strings = []
+                codes = {}
+                encoded = array("l")
+                for value in values:
+                    code = codes.get(value)
+                    if code is None:
+                        code = len(strings)
+                        codes[value] = code
+                        strings.append(value)
+                    encoded.append(code)
+                self.__strings[column] = strings
+                self.__codes[column] = codes
+                self.__columns[column] = encoded
+            elif column == "PRIORITY":
+                self.__columns[column] = array("l", values)
+            elif isinstance(defaults.get(column), bool):
+                self.__columns[column] = array("b", values)
+                self.__bools.add(column)
+            else:
+                self.__columns[column] = values
+
+    @classmethod
+    def from_columns(cls, length, defaults, columns, strings, bools):
+        # Make a catalog around columns which are already built, such as
+        # memoryviews of a shared memory segment.  Nothing is copied.
+        #   columns : {column: sequence of values, or of codes if it has strings}
+        #   strings : {column: sequence of the distinct strings its codes index}
+        #   bools   : names of the columns which hold bools
+        catalog = cls.__new__(cls)
+        catalog.__length = length
+        catalog.__defaults = defaults
+        catalog.__columns = dict(columns)
+        catalog.__strings = dict(strings)
+        catalog.__codes = {}
+        catalog.__bools = set(bools)
+        catalog.__indexes = {}
+        return catalog
+
+    def __len__(self):
+        return self.__length
+
+    def columns(self):
+        return list(self.__columns.keys())
+
+    def defaults(self):
+        return self.__defaults
+
+    def column_data(self, column):
+        # Get the raw data of a column, as (values or codes, strings, is bool).
+        # strings is None if the column is not dictionary encoded.
+        return (
+            self.__columns[column],
+            self.__strings.get(column),
+            column in self.__bools,
+        )
+
+    def value(self, index, column):
+        # Get a single decoded value from the catalog.
+        data = self.__columns[column][index]
+        if column in self.__strings:
+            return self.__strings[column][data]
+        if column in self.__bools:
+            return bool(data)
+        return data
+
+    def row(self, index):
+        # Get a single row, as the same dict DataTableFile.getAllData() holds.
+        return {column: self.value(index, column) for column in self.__columns}
+
+    def rows(self, indexes=None):
+        if indexes is None:
+            indexes = range(self.__length)
+        return [self.row(index) for index in indexes]
+
+    def distinct(self, column):
+        # Get the unique values of a column, in the order they were first read.
+        if column in self.__strings:
+            return list(self.__strings[column])
+        return list(
+            dict.fromkeys(self.value(index, column) for index in range(self.__length))
+        )
+
+    def where(self, column, value):
+        # Get the index of every row whose column has the value.
+        if column in self.__strings:
+            if column not in self.__codes:
+                self.__codes[column] = {
+                    string: code for code, string in enumerate(self.__strings[column])
+                }
+            code = self.__codes[column].get(value)
+            if code is None:
+                return []
+            return [
+                index
+                for index, data in enumerate(self.__columns[column])
+                if data == code
+            ]
+        return [
+            index
+            for index in range(self.__length)
+            if self.value(index, column) == value
+        ]
+
+    def lookup(self, columns, key):
+        # Get the index of every row whose columns match the key tuple.
+        # eg. lookup(("MFG", "MPN"), ("Yageo", "RC0402FR-0710KL"))
+        # The hash index for the columns is built the first time they are used.
+        columns = tuple(columns)
+        if columns not in self.__indexes:
+            index_map = {}
+            for index in range(self.__length):
+                row_key = tuple(self.value(index, column) for column in columns)
+                index_map.setdefault(row_key, []).append(index)
+            self.__indexes[columns] = index_map
+        return self.__indexes[columns].get(tuple(key), [])
+
+    def group_by(self, column):
+        # Get a dict of each value of the column, to the index of its rows.
+        groups = {}
+        if column in self.__strings:
+            strings = self.__strings[column]
+            for index, code in enumerate(self.__columns[column]):
+                groups.setdefault(strings[code], []).append(index)
+        else:
+            for index in range(self.__length):
+                groups.setdefault(self.value(index, column), []).append(index)
+        return groups
+
+
 class PartCache:
     __COLUMNS = [""]
 
@@ -216,36 +412,61 @@ class ExtraParts(DataTableFile):
             },
         )
 
-    def getParts(self, variant=None, known_refs=[]):
+    def getParts(self, variant=None, known_refs=None):
         # Get the unique extra parts list for the named variant.
         # only gets parts whose ref is not already known.
+        # Any refs found are added to known_refs.
+        if known_refs is None:
+            known_refs = []
+        catalog = self.getCatalog()
+        seen_refs = set(known_refs)
+
         def add_extra_parts(variant):
-            for row in self.getAllData():
-                if row["VARIANT"] == variant:
-                    if row["REF"] not in known_refs:
-                        known_refs.append(row["REF"])
-                        parts.append(row)
+            for index in catalog.where("VARIANT", variant):
+                ref = catalog.value(index, "REF")
+                if ref not in seen_refs:
+                    seen_refs.add(ref)
+                    known_refs.append(ref)
+                    parts.append(catalog.row(index))
 
         parts = []
         add_extra_parts(variant)
-        add_extra_parts(self.__DEFAULTS["VARIANT"])
+        add_extra_parts(self.getDefaults()["VARIANT"])
 
         return parts
 
-    def getExtraVariants(self, known_variants=[]):
+    def getExtraVariants(self, known_variants=None):
+        # Get the variants only found in the extra parts.
+        # Any variants found are added to known_variants.
+        if known_variants is None:
+            known_variants = []
+        seen_variants = set(known_variants)
+
         extra_variants = []
-        for row in self.getAllData():
-            if row["VARIANT"] not in known_variants:
-                known_variants.append(row["VARIANT"])
-                extra_variants.append(row["VARIANT"])
+        for variant in self.getCatalog().distinct("VARIANT"):
+            if variant not in seen_variants:
+                seen_variants.add(variant)
+                known_variants.append(variant)
+                extra_variants.append(variant)
 
         return extra_variants
 
 
 class AllData:
-    def __init__(self):
+    TABLES = {
+        "stock": StockData,
+        "equivalents": EquivalentsData,
+        "pricings": PricingData,
+        "extras": ExtraParts,
+    }
+
+    def __init__(self, catalogs=None):
+        # Read all the data tables.
+        # If catalogs {table name: PartCatalog} is given, the tables are made
+        # from those catalogs instead, eg. from the shared memory data plane.
         # part_cache = PartCache()
-        self.stock = StockData()
-        self.equivalents = EquivalentsData()
-        self.pricings = PricingData()
-        self.extras = ExtraParts()
+        for name, table in self.TABLES.items():
+            if catalogs is None:
+                setattr(self, name, table())
+            else:
+                setattr(self, name, table.fromCatalog(catalogs[name]))
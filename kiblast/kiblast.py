@@ -16,8 +16,21 @@ from .defs import defs
 from .config import KiBlastConfig
 from .eeschema_xml import eeschema_xml
 from .datafiles import DataTableFile, AllData
+from .costing import BomCosting, Scenario, sweep_scenarios, dump_sweep
+from .snapshot import (
+    snapshot_path,
+    hash_bytes,
+    make_snapshot,
+    write_snapshot,
+    read_snapshot,
+    changed_options,
+    same_infile,
+    stale_inputs,
+    write_bom,
+)
 
 import click
+import io
 import os
 import appdirs
 
@@ -36,7 +49,25 @@ def main():
 @click.argument("outfile", type=click.Path(dir_okay=False))
 @click.option("--nostock", is_flag=True, help="Dont use parts in stock")
 @click.option("--nooctopart", is_flag=True, help="Dont cost parts on octopart")
-def bom(infile, outfile, nostock, nooctopart):
+@click.option(
+    "--qty",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of boards to build",
+)
+@click.option("--variant", default="COMMON", show_default=True, help="Variant to cost")
+@click.option(
+    "--from-snapshot",
+    is_flag=True,
+    help="Output the BOM from the snapshot of a previous run",
+)
+@click.option(
+    "--check-stale",
+    is_flag=True,
+    help="With --from-snapshot, check the configuration and data files are unchanged",
+)
+def bom(infile, outfile, nostock, nooctopart, qty, variant, from_snapshot, check_stale):
     """ Generate a BOM from the XML Data exported by KiCad.
 
     INFILE  the Name of the XML Schematic Data file generated by KiCad.
@@ -45,8 +76,16 @@ def bom(infile, outfile, nostock, nooctopart):
     \b
             OUTFILE with extension
                 .csv is generated as a text CSV file.
-                .xlsx is generated as Microsoft Excel spreadsheet.
+                .xlsx (Microsoft Excel spreadsheet) is not supported yet.
                 Anything else is an error.
+
+    \b
+            A snapshot of the costed BOM is written next to OUTFILE.
+            --from-snapshot outputs the BOM again from that snapshot,
+            without loading the data files, cache or octopart.
+            It is an error if the options or INFILE have changed since
+            the snapshot was made.  --check-stale also makes it an error
+            if the configuration or the data files have changed.
     """
 
     # Get active configuration
@@ -58,14 +97,109 @@ def bom(infile, outfile, nostock, nooctopart):
     output_type = os.path.splitext(outfile)[1]
     if output_type not in [".csv", ".xlsx"]:
         print(
-            "Output File Type '{}' is Unknown.  Use '.csv' or '.xlsx'. Aborted!!".format(
+            "Output File Type '{}' is Unknown.  Use '.csv'. Aborted!!".format(
                 output_type
             )
         )
         exit(2)
+    if output_type == ".xlsx":
+        print("Output File Type '.xlsx' is not supported yet.  Use '.csv'. Aborted!!")
+        exit(2)
+
+    infile_data = infile.read()
+    infile_hash = hash_bytes(infile_data)
+    snapshot_file = snapshot_path(outfile)
+    scenario = Scenario(not nostock, not nooctopart, None, qty)
+
+    if from_snapshot:
+        snapshot = read_snapshot(snapshot_file)
+        if snapshot is None:
+            print("No usable snapshot '{}'. Aborted!!".format(snapshot_file))
+            exit(2)
+
+        changed = changed_options(snapshot, scenario, variant)
+        if len(changed) > 0:
+            print(
+                "Snapshot '{}' was made with different options:".format(snapshot_file)
+            )
+            for option, snapshot_value, value in changed:
+                print(
+                    "    {} : {} (requested {})".format(option, snapshot_value, value)
+                )
+            print("Aborted!!")
+            exit(1)
+
+        if not same_infile(snapshot, infile_hash):
+            print(
+                "Snapshot '{}' was made from a different INFILE. Aborted!!".format(
+                    snapshot_file
+                )
+            )
+            exit(1)
+
+        # Only touch the data directories when asked to.
+        if check_stale:
+            stale = stale_inputs(snapshot, cfg)
+            if len(stale) > 0:
+                print("Snapshot '{}' is stale, changed:".format(snapshot_file))
+                for filename in stale:
+                    print("    " + filename)
+                print("Aborted!!")
+                exit(1)
+
+        write_bom(outfile, snapshot)
+        return
 
     # OK, so start processing the BOM.
     data = AllData()
+    eexml = eeschema_xml(io.BytesIO(infile_data), cfg)
+    costing = BomCosting(
+        eexml, data, variant, cfg.get("www.octopart.com", "distributors")
+    )
+
+    snapshot = make_snapshot(costing, scenario, infile_hash, data, variant, cfg)
+    write_snapshot(snapshot_file, snapshot)
+    write_bom(outfile, snapshot)
+
+
+@main.command()
+@click.argument("infile", type=click.File("rb"))
+@click.option(
+    "--qty",
+    "quantities",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=[1],
+    show_default=True,
+    help="Number of boards to build, may be given more than once",
+)
+@click.option("--variant", default="COMMON", show_default=True, help="Variant to cost")
+@click.option("--nostock", is_flag=True, help="Dont sweep parts in stock")
+@click.option("--nooctopart", is_flag=True, help="Dont sweep parts on octopart")
+def sweep(infile, quantities, variant, nostock, nooctopart):
+    """ Compare the cost of the BOM across what-if scenarios.
+
+    INFILE  the Name of the XML Schematic Data file generated by KiCad.
+
+    \b
+            The BOM is resolved once, then costed with and without stock,
+            with and without octopart, for each of the configured distributors,
+            at each build quantity.  Local price files are always used, those
+            named after a distributor, eg. digikey.price.csv for "Digi-Key",
+            are limited to it when that distributor is swept.
+            Combinations which can't change the cost are not shown.
+    """
+    # Get active configuration
+    cfg = KiBlastConfig()
+
+    eexml = eeschema_xml(infile, cfg)
+    data = AllData()
+    costing = BomCosting(
+        eexml, data, variant, cfg.get("www.octopart.com", "distributors")
+    )
+
+    scenarios = sweep_scenarios(costing, sorted(set(quantities)), nostock, nooctopart)
+    dump_sweep(costing.sweep(scenarios))
 
 
 @main.command()
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""KiBlast Shared Memory Data Plane
+
+Publishes the loaded data tables as read only shared memory segments, so
+concurrent workers can attach to one copy of the data instead of each
+loading their own.
+
+Each table is one segment laid out as:
+    8 byte header length, JSON header, then 8 byte aligned blocks of
+    int64 code/value columns, int8 bool columns and a string table.
+Every column which is not an int or bool column is dictionary encoded,
+its codes index a range of entries in the string table.
+
+SPDX-License-Identifier: GPL-3.0-or-later
+Copyright © 2019 Steven Johnson
+"""
+from .datafiles import AllData, PartCatalog
+
+import json
+import os
+import struct
+
+try:
+    from multiprocessing import parent_process, shared_memory, resource_tracker
+except ImportError:  # Python before 3.8
+    shared_memory = None
+
+# Kinds of entry in the string table, so values read back as the type they were.
+STRING, NONE, INT, FLOAT = range(4)
+
+HEADER_SIZE = struct.Struct("<q")
+
+
+def available():
+    return shared_memory is not None
+
+
+def segment_name(prefix, table):
+    return "{}_{}".format(prefix, table)
+
+
+class _StringTable:
+    # Sequence of a range of entries in a shared string table.
+    # Entries are decoded when they are read, nothing is copied up front.
+
+    def __init__(self, offsets, kinds, blob, start, end):
+        self.__offsets = offsets
+        self.__kinds = kinds
+        self.__blob = blob
+        self.__start = start
+        self.__end = end
+
+    def __len__(self):
+        return self.__end - self.__start
+
+    def __getitem__(self, code):
+        if (code < 0) or (code >= len(self)):
+            raise IndexError(code)
+        entry = self.__start + code
+        kind = self.__kinds[entry]
+        if kind == NONE:
+            return None
+        text = bytes(
+            self.__blob[self.__offsets[entry] : self.__offsets[entry + 1]]
+        ).decode("utf-8")
+        if kind == INT:
+            return int(text)
+        if kind == FLOAT:
+            return float(text)
+        return text
+
+    def __iter__(self):
+        for code in range(len(self)):
+            yield self[code]
+
+
+def _encode_entry(value):
+    if value is None:
+        return NONE, b""
+    if isinstance(value, int):
+        return INT, str(value).encode("utf-8")
+    if isinstance(value, float):
+        return FLOAT, repr(value).encode("utf-8")
+    return STRING, str(value).encode("utf-8")
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _layout_catalog(catalog):
+    # Work out the header and the blocks to write for a catalog.
+    header = {
+        "length": len(catalog),
+        "defaults": catalog.defaults(),
+        "columns": [],
+        "publisher": os.getpid(),
+    }
+    blocks = []
+    entries = []
+
+    for column in catalog.columns():
+        values, strings, is_bool = catalog.column_data(column)
+        if is_bool:
+            blocks.append(bytes(bytearray(1 if value else 0 for value in values)))
+            header["columns"].append({"name": column, "type": "bool"})
+        elif (strings is None) and all(
+            isinstance(value, int) and not isinstance(value, bool) for value in values
+        ):
+            blocks.append(struct.pack("<{}q".format(len(values)), *values))
+            header["columns"].append({"name": column, "type": "int"})
+        else:
+            if strings is None:
+                # Dictionary encode it now.
+                strings = []
+                codes = {}
+                encoded = []
+                for value in values:
+                    code = codes.get(value)
+                    if code is None:
+                        code = len(strings)
+                        codes[value] = code
+                        strings.append(value)
+                    encoded.append(code)
+                values = encoded
+            blocks.append(struct.pack("<{}q".format(len(values)), *values))
+            header["columns"].append(
+                {
+                    "name": column,
+                    "type": "codes",
+                    "strings": [len(entries), len(entries) + len(strings)],
+                }
+            )
+            entries.extend(strings)
+
+    kinds = bytearray()
+    offsets = [0]
+    blob = bytearray()
+    for entry in entries:
+        kind, text = _encode_entry(entry)
+        kinds.append(kind)
+        blob.extend(text)
+        offsets.append(len(blob))
+    header["entries"] = len(entries)
+    blocks.append(struct.pack("<{}q".format(len(offsets)), *offsets))
+    blocks.append(bytes(kinds))
+    blocks.append(bytes(blob))
+
+    # Now the header is complete, place the blocks after it.
+    header["blocks"] = []
+    offset = 0
+    for block in blocks:
+        header["blocks"].append([offset, len(block)])
+        offset = _align(offset + len(block))
+    header_json = json.dumps(header).encode("utf-8")
+    data_start = _align(HEADER_SIZE.size + len(header_json))
+
+    return header_json, data_start, blocks, data_start + offset
+
+
+class SharedData:
+    # Publishes the tables of an AllData as shared memory segments.
+    # The publisher owns the segments, and must unlink() them when all
+    # workers are finished with them.
+    # Workers may be started by multiprocessing from the publisher, with any
+    # start method, or be separate processes.
+
+    def __init__(self, data, prefix=None):
+        if not available():
+            raise RuntimeError("Shared memory needs Python 3.8 or later.")
+
+        if prefix is None:
+            prefix = "{}_{}".format("kiblast", os.getpid())
+        self.prefix = prefix
+        self.__segments = []
+
+        try:
+            for table in AllData.TABLES:
+                self.__segments.append(
+                    self._publish(
+                        getattr(data, table).getCatalog(), segment_name(prefix, table)
+                    )
+                )
+        except Exception:
+            self.unlink()
+            raise
+
+    @staticmethod
+    def _publish(catalog, name):
+        header_json, data_start, blocks, size = _layout_catalog(catalog)
+
+        segment = shared_memory.SharedMemory(name=name, create=True, size=max(size, 1))
+        buf = segment.buf
+        HEADER_SIZE.pack_into(buf, 0, len(header_json))
+        buf[HEADER_SIZE.size : HEADER_SIZE.size + len(header_json)] = header_json
+        offset = data_start
+        for block in blocks:
+            buf[offset : offset + len(block)] = block
+            offset = _align(offset + len(block))
+        del buf
+        return segment
+
+    def close(self):
+        for segment in self.__segments:
+            segment.close()
+
+    def unlink(self):
+        # Remove the segments.  Workers already attached keep their mappings.
+        for segment in self.__segments:
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                # Already removed by someone else.
+                pass
+        self.__segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
+
+
+class AttachedData:
+    # Attaches to the segments published by SharedData.
+    # self.data is an AllData whose catalogs read straight from shared memory.
+
+    def __init__(self, prefix):
+        if not available():
+            raise RuntimeError("Shared memory needs Python 3.8 or later.")
+
+        self.__segments = []
+        self.__views = []
+
+        catalogs = {}
+        try:
+            for table in AllData.TABLES:
+                catalogs[table] = self._attach(segment_name(prefix, table))
+        except Exception:
+            self.close()
+            raise
+        self.data = AllData(catalogs)
+
+    def _view(self, buf, start, length, fmt):
+        view = buf[start : start + length].cast(fmt)
+        self.__views.append(view)
+        return view
+
+    def _attach(self, name):
+        try:
+            # Dont let this process's resource tracker unlink the publisher's segment.
+            segment = shared_memory.SharedMemory(name=name, track=False)
+            tracked = False
+        except TypeError:  # Python before 3.13
+            segment = shared_memory.SharedMemory(name=name)
+            tracked = True
+        self.__segments.append(segment)
+
+        buf = segment.buf.toreadonly()
+        self.__views.append(buf)
+
+        header_size = HEADER_SIZE.unpack_from(buf, 0)[0]
+        header = json.loads(
+            bytes(buf[HEADER_SIZE.size : HEADER_SIZE.size + header_size])
+        )
+        data_start = _align(HEADER_SIZE.size + header_size)
+
+        # Attaching registered the segment with our resource tracker.
+        # The publisher, and workers started from it by multiprocessing, share
+        # its tracker, where the segment is already registered, and the
+        # publisher's unlink() unregisters it.
+        # Any other process has its own tracker, which would unlink the
+        # segment when this process exits.  It isn't ours to unlink.
+        shared_tracker = (os.getpid() == header["publisher"]) or (
+            parent_process() is not None
+        )
+        if tracked and not shared_tracker:
+            resource_tracker.unregister(segment._name, "shared_memory")
+
+        blocks = [(data_start + offset, length) for offset, length in header["blocks"]]
+
+        offsets = self._view(buf, blocks[-3][0], blocks[-3][1], "q")
+        kinds = self._view(buf, blocks[-2][0], blocks[-2][1], "b")
+        blob = self._view(buf, blocks[-1][0], blocks[-1][1], "B")
+
+        columns = {}
+        strings = {}
+        bools = []
+        for column, (start, length) in zip(header["columns"], blocks):
+            name = column["name"]
+            if column["type"] == "bool":
+                columns[name] = self._view(buf, start, length, "b")
+                bools.append(name)
+            else:
+                columns[name] = self._view(buf, start, length, "q")
+            if column["type"] == "codes":
+                first, last = column["strings"]
+                strings[name] = _StringTable(offsets, kinds, blob, first, last)
+
+        return PartCatalog.from_columns(
+            header["length"], header["defaults"], columns, strings, bools
+        )
+
+    def close(self):
+        # The data must not be used after it is closed.
+        for view in reversed(self.__views):
+            view.release()
+        self.__views = []
+        for segment in self.__segments:
+            segment.close()
+        self.__segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
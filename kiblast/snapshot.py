@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""KiBlast Resolved BOM Snapshots
+
+A snapshot records every decision made while costing a BOM, the part,
+source, price break and stock used for each line, together with hashes of
+the schematic, data files and configuration it was made from.  It is
+written next to
+the BOM, so the BOM can be output again later without reading the data
+files, the cache or going to the network.
+
+SPDX-License-Identifier: GPL-3.0-or-later
+Copyright © 2019 Steven Johnson
+"""
+from .defs import defs
+from .datafiles import AllData, DataTableFile
+
+import csv
+import hashlib
+import json
+import os
+
+SNAPSHOT_VERSION = 2
+
+BOM_COLUMNS = [
+    "REFS",
+    "QTY",
+    "MFG",
+    "MPN",
+    "STOCK",
+    "SOURCE",
+    "BUY MFG",
+    "BUY MPN",
+    "MOQ",
+    "PRICE",
+    "BUY QTY",
+    "COST",
+]
+
+
+def snapshot_path(outfile):
+    # The snapshot for a BOM lives next to it, eg. board.csv -> board.kiblast.json
+    return os.path.splitext(outfile)[0] + "." + defs.appname() + ".json"
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(filename):
+    # Hash of a files contents, or None if it can not be read.
+    try:
+        with open(filename, "rb") as f:
+            return hash_bytes(f.read())
+    except IOError:
+        return None
+
+
+def hash_config(cfg):
+    return hash_bytes(json.dumps(cfg.values(), sort_keys=True).encode("utf-8"))
+
+
+def make_snapshot(costing, scenario, infile_hash, data, variant, cfg):
+    # Record the costing of the scenario and what it was made from.
+    choices, total = costing.cost(scenario)
+
+    lines = []
+    for line, choice in zip(costing.lines, choices):
+        lines.append(
+            {
+                "REFS": line["REFS"],
+                "QTY": choice["QTY"],
+                "MFG": line["MFG"],
+                "MPN": line["MPN"],
+                "STOCK": [list(stock) for stock in choice["STOCK"]],
+                "SOURCE": choice["SOURCE"],
+                "BUY MFG": choice["MFG"],
+                "BUY MPN": choice["MPN"],
+                "BREAK": None if choice["BREAK"] is None else list(choice["BREAK"]),
+                "BUY QTY": choice["BUY_QTY"],
+                "COST": choice["COST"],
+                "SHORT": choice["SHORT"],
+            }
+        )
+
+    data_files = {}
+    for table in AllData.TABLES:
+        data_table = getattr(data, table)
+        data_files[table] = {
+            "basename": data_table.getBasename(),
+            "files": {
+                filename: hash_file(filename) for filename in data_table.getDataFiles()
+            },
+        }
+
+    return {
+        "version": SNAPSHOT_VERSION,
+        "kiblast": defs.SHORTVERSION,
+        "variant": variant,
+        "scenario": scenario._asdict(),
+        "infile": infile_hash,
+        "config": hash_config(cfg),
+        "data_files": data_files,
+        "total": total,
+        "lines": lines,
+    }
+
+
+def write_snapshot(filename, snapshot):
+    with open(filename, "w") as f:
+        json.dump(snapshot, f, indent=1)
+
+
+def read_snapshot(filename):
+    # Returns the snapshot, or None if there isn't a usable one.
+    try:
+        with open(filename) as f:
+            snapshot = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+def changed_options(snapshot, scenario, variant):
+    # List the options which differ from the ones the snapshot was made with,
+    # as (option, snapshot value, requested value).
+    changed = []
+    if snapshot["variant"] != variant:
+        changed.append(("variant", snapshot["variant"], variant))
+    for option, value in scenario._asdict().items():
+        if snapshot["scenario"].get(option) != value:
+            changed.append((option, snapshot["scenario"].get(option), value))
+    return changed
+
+
+def same_infile(snapshot, infile_hash):
+    # True if the snapshot was made from this INFILE.
+    return snapshot["infile"] == infile_hash
+
+
+def stale_inputs(snapshot, cfg):
+    # List the configuration and data files which have changed since the
+    # snapshot was made.  The data directories are listed again, so added or
+    # removed data files are found as well as changed ones.
+    # No data file is loaded.
+    stale = []
+    if snapshot["config"] != hash_config(cfg):
+        stale.append("CONFIGURATION")
+    for table in AllData.TABLES:
+        recorded = snapshot["data_files"][table]
+        files = recorded["files"]
+        found = DataTableFile.findDataFiles(recorded["basename"])
+        for filename in found:
+            if filename not in files:
+                stale.append(filename + " (added)")
+            elif hash_file(filename) != files[filename]:
+                stale.append(filename)
+        for filename in files:
+            if filename not in found:
+                stale.append(filename + " (removed)")
+    return stale
+
+
+def write_bom(outfile, snapshot):
+    # Output the BOM recorded in a snapshot, only csv is supported so far.
+    _write_bom_csv(outfile, snapshot)
+
+
+def _bom_rows(snapshot):
+    for line in snapshot["lines"]:
+        stock = "; ".join(
+            "{} {} x{} @{:.4f}".format(mfg, mpn, used, unit_cost)
+            for mfg, mpn, used, unit_cost in line["STOCK"]
+        )
+        moq, price = line["BREAK"] if line["BREAK"] is not None else ("", "")
+        cost = "{:.2f}".format(line["COST"])
+        if line["SHORT"] > 0:
+            cost += " ({} not costed)".format(line["SHORT"])
+        yield [
+            " ".join(line["REFS"]),
+            line["QTY"],
+            line["MFG"],
+            line["MPN"],
+            stock,
+            line["SOURCE"] or "",
+            line["BUY MFG"] or "",
+            line["BUY MPN"] or "",
+            moq,
+            price,
+            line["BUY QTY"] or "",
+            cost,
+        ]
+
+
+def _write_bom_csv(outfile, snapshot):
+    with open(outfile, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile, dialect="excel", escapechar="\\")
+        writer.writerow(BOM_COLUMNS)
+        for row in _bom_rows(snapshot):
+            writer.writerow(row)
+        writer.writerow(
+            ["TOTAL"]
+            + [""] * (len(BOM_COLUMNS) - 2)
+            + ["{:.2f}".format(snapshot["total"])]
+        )
@@ -0,0 +1,74 @@
+import os
+import stat
+
+import pytest
+
+pytest.importorskip("tomlkit")
+pytest.importorskip("appdirs")
+
+from kiblast.config import KiBlastConfig  # noqa: E402
+
+
+@pytest.fixture
+def cfg_files(tmp_path, monkeypatch):
+    names = [
+        (str(tmp_path / "local.toml"), "LOCAL"),
+        (str(tmp_path / "user.toml"), "USER"),
+        (str(tmp_path / "system.toml"), "SYSTEM"),
+    ]
+    monkeypatch.setattr(KiBlastConfig, "CFG_NAMES", names)
+    monkeypatch.setattr(KiBlastConfig, "CACHE_FILE", str(tmp_path / "cache.json"))
+    monkeypatch.setattr(KiBlastConfig, "_KiBlastConfig__resolved", {})
+    return names
+
+
+def write_cfg(filename, apikey, mtime=None):
+    with open(filename, "w") as f:
+        f.write('["www.octopart.com"]\napikey = "{}"\n'.format(apikey))
+    if mtime is not None:
+        os.utime(filename, ns=(mtime, mtime))
+
+
+def test_defaults_and_sources(cfg_files):
+    write_cfg(cfg_files[1][0], "USERKEY")
+    cfg = KiBlastConfig()
+    assert cfg.get("www.octopart.com", "apikey") == "USERKEY"
+    assert cfg.source("www.octopart.com", "apikey") == "USER"
+    assert cfg.get("kicad", "mfg_field") == "MFG"
+    assert cfg.source("kicad", "mfg_field") == "DEFAULT"
+
+
+def test_cache_invalidated_by_size_change(cfg_files):
+    write_cfg(cfg_files[0][0], "A")
+    assert KiBlastConfig().get("www.octopart.com", "apikey") == "A"
+    write_cfg(cfg_files[0][0], "BB")
+    assert KiBlastConfig().get("www.octopart.com", "apikey") == "BB"
+
+
+def test_cache_invalidated_by_mtime_change(cfg_files):
+    write_cfg(cfg_files[0][0], "A", mtime=1000000000)
+    assert KiBlastConfig().get("www.octopart.com", "apikey") == "A"
+    # Same size, only the modification time differs.
+    write_cfg(cfg_files[0][0], "B", mtime=2000000000)
+    assert KiBlastConfig().get("www.octopart.com", "apikey") == "B"
+
+
+def test_disk_cache_used_and_private(cfg_files, monkeypatch):
+    write_cfg(cfg_files[0][0], "SECRET")
+    KiBlastConfig()
+    cache_file = KiBlastConfig.CACHE_FILE
+    assert stat.S_IMODE(os.stat(cache_file).st_mode) == 0o600
+
+    # A new process has an empty in process cache, and must not re-parse.
+    monkeypatch.setattr(KiBlastConfig, "_KiBlastConfig__resolved", {})
+
+    def no_parse(*args, **kwargs):
+        raise AssertionError("config was re-parsed")
+
+    monkeypatch.setattr(KiBlastConfig, "_resolve_toml", no_parse)
+    assert KiBlastConfig().get("www.octopart.com", "apikey") == "SECRET"
+
+
+def test_get_returns_copy(cfg_files):
+    KiBlastConfig().get("www.octopart.com", "distributors").append("X")
+    assert "X" not in KiBlastConfig().get("www.octopart.com", "distributors")
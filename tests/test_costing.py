@@ -0,0 +1,200 @@
+import pytest
+
+pytest.importorskip("appdirs")
+
+from kiblast.costing import BomCosting, Scenario, sweep_scenarios  # noqa: E402
+from kiblast.datafiles import AllData, PartCatalog  # noqa: E402
+
+
+class FakeSchematic:
+    # Just enough of eeschema_xml for BomCosting.
+    def __init__(self, parts):
+        # parts is {ref: (MFG, MPN)}
+        self.__parts = parts
+
+    def get_all_refs(self):
+        return sorted(self.__parts)
+
+    def get_component(self, ref):
+        mfg, mpn = self.__parts[ref]
+        part = {"MFG": mfg, "MPN": mpn, "EQUIVOK": True, "FITTED": True}
+        return [{"REF": ref, "PARTS": {"COMMON": part}}]
+
+
+def catalog(defaults, rows):
+    full_rows = []
+    for row in rows:
+        full_row = dict(row)
+        full_row.setdefault("EXTRA", "")
+        full_row.setdefault("PRIORITY", 0)
+        full_row.setdefault("SOURCE", "COMMON")
+        full_rows.append(full_row)
+    return PartCatalog(full_rows, defaults)
+
+
+def make_data(stock=(), prices=(), equivalents=()):
+    return AllData(
+        {
+            "stock": catalog(
+                {"MFG": None, "MPN": None, "COST": None, "QTY_ON_HAND": 0}, stock
+            ),
+            "equivalents": catalog({"MFG": None, "MPN": None}, equivalents),
+            "pricings": catalog({"MFG": None, "MPN": None, "LINK": None}, prices),
+            "extras": catalog(
+                {"REF": None, "VARIANT": "COMMON", "MFG": "Generic", "MPN": None},
+                [],
+            ),
+        }
+    )
+
+
+def stock_row(mfg, mpn, cost, cost_qty, on_hand):
+    return {
+        "MFG": mfg,
+        "MPN": mpn,
+        "COST": cost,
+        "COST_QTY": cost_qty,
+        "QTY_ON_HAND": on_hand,
+    }
+
+
+def price_row(mfg, mpn, source, breaks):
+    return {"MFG": mfg, "MPN": mpn, "LINK": None, "SOURCE": source, "EXTRA": breaks}
+
+
+def check_buy_cost(breaks, qty, cost, price_break, buy_qty):
+    result = BomCosting._buy_cost(breaks, qty)
+    assert result[0] == pytest.approx(cost)
+    assert result[1:] == (price_break, buy_qty)
+
+
+def test_buy_cost_picks_cheapest_break():
+    breaks = [(1, 0.10), (100, 0.01)]
+    check_buy_cost(breaks, 19, 1.00, (100, 0.01), 100)
+    check_buy_cost(breaks, 5, 0.50, (1, 0.10), 5)
+    check_buy_cost(breaks, 150, 1.50, (100, 0.01), 150)
+
+
+def test_buy_cost_below_first_moq():
+    check_buy_cost([(10, 0.05)], 3, 0.50, (10, 0.05), 10)
+
+
+def test_stock_used_before_buying():
+    costing = BomCosting(
+        FakeSchematic({"R1": ("Yageo", "RC10K"), "R2": ("Yageo", "RC10K")}),
+        make_data(
+            stock=[stock_row("Yageo", "RC10K", "1.00", "100", "50")],
+            prices=[price_row("Yageo", "RC10K", "LCSC", "1, 0.10, 100, 0.02")],
+        ),
+    )
+    choices, total = costing.cost(Scenario(True, True, None, 100))
+    choice = choices[0]
+    assert choice["QTY"] == 200
+    assert choice["STOCK"] == [("Yageo", "RC10K", 50, 0.01)]
+    assert choice["BUY_QTY"] == 150
+    assert choice["BREAK"] == (100, 0.02)
+    assert choice["SHORT"] == 0
+    assert total == pytest.approx(0.5 + 3.0)
+
+    choices, total = costing.cost(Scenario(False, True, None, 100))
+    assert choices[0]["STOCK"] == []
+    assert total == pytest.approx(4.0)
+
+
+def test_stock_kept_when_rest_can_not_be_bought():
+    costing = BomCosting(
+        FakeSchematic({"R1": ("Yageo", "RC10K")}),
+        make_data(stock=[stock_row("Yageo", "RC10K", "2.00", "1", "3")]),
+    )
+    choices, total = costing.cost(Scenario(True, True, None, 5))
+    assert choices[0]["SHORT"] == 2
+    assert total == pytest.approx(6.0)
+    assert costing.sweep([Scenario(True, True, None, 5)]) == {
+        Scenario(True, True, None, 5): (pytest.approx(6.0), 1)
+    }
+
+
+def test_equivalent_in_stock_is_used():
+    costing = BomCosting(
+        FakeSchematic({"C1": ("Murata", "GRM1U")}),
+        make_data(
+            stock=[stock_row("TDK", "C1U", "0.10", "1", "10")],
+            equivalents=[{"MFG": "Murata", "MPN": "GRM1U", "EXTRA": "TDK, C1U"}],
+        ),
+    )
+    choices, total = costing.cost(Scenario(True, True, None, 4))
+    assert choices[0]["STOCK"] == [("TDK", "C1U", 4, 0.1)]
+    assert total == pytest.approx(0.4)
+
+
+def test_stock_shared_between_lines():
+    costing = BomCosting(
+        FakeSchematic({"R1": ("Yageo", "RC10K"), "R2": ("Yageo", "ALT10K")}),
+        make_data(
+            stock=[stock_row("Yageo", "RC10K", "1.00", "1", "3")],
+            prices=[price_row("Yageo", "ALT10K", "LCSC", "1, 0.10")],
+            equivalents=[{"MFG": "Yageo", "MPN": "ALT10K", "EXTRA": "Yageo, RC10K"}],
+        ),
+    )
+    choices, total = costing.cost(Scenario(True, False, None, 2))
+    assert choices[0]["STOCK"] == [("Yageo", "RC10K", 2, 1.0)]
+    assert choices[1]["STOCK"] == [("Yageo", "RC10K", 1, 1.0)]
+    assert choices[1]["BUY_QTY"] == 1
+    assert total == pytest.approx(3.0 + 0.10)
+
+
+def test_sweep_matches_each_cost():
+    costing = BomCosting(
+        FakeSchematic({"R1": ("Yageo", "RC10K"), "R2": ("Yageo", "ALT10K")}),
+        make_data(
+            stock=[stock_row("Yageo", "RC10K", "1.00", "1", "3")],
+            prices=[
+                price_row("Yageo", "RC10K", "LCSC", "1, 0.20, 10, 0.05"),
+                price_row("Yageo", "ALT10K", "LCSC", "1, 0.10"),
+            ],
+            equivalents=[{"MFG": "Yageo", "MPN": "ALT10K", "EXTRA": "Yageo, RC10K"}],
+        ),
+    )
+    scenarios = sweep_scenarios(costing, [1, 2, 20])
+    results = costing.sweep(scenarios)
+    assert list(results) == scenarios
+    for scenario in scenarios:
+        choices, total = costing.cost(scenario)
+        assert results[scenario] == (pytest.approx(total), 0)
+
+
+def test_distributors_and_sweep_scenarios():
+    costing = BomCosting(
+        FakeSchematic({"R1": ("Yageo", "RC10K")}),
+        make_data(
+            prices=[
+                price_row("Yageo", "RC10K", "digikey", "1, 0.10"),
+                price_row("Yageo", "RC10K", "mouser", "1, 0.08"),
+                price_row("Yageo", "RC10K", "LCSC", "1, 0.20"),
+            ]
+        ),
+        distributors=["element14 APAC", "Digi-Key", "Mouser"],
+    )
+    assert costing.offered_distributors() == ["Digi-Key", "Mouser"]
+    assert not costing.has_octopart()
+    # Local price files are used with or without octopart.
+    assert costing.cost(Scenario(False, False, None, 1))[1] == pytest.approx(0.08)
+    assert costing.cost(Scenario(False, True, None, 1))[1] == pytest.approx(0.08)
+    assert costing.cost(Scenario(False, False, "Digi-Key", 1))[1] == pytest.approx(
+        0.10
+    )
+
+    # No stock, no Octopart cache, and element14 prices nothing, so none are swept.
+    assert sweep_scenarios(costing, [1]) == [
+        Scenario(False, False, None, 1),
+        Scenario(False, False, "Digi-Key", 1),
+        Scenario(False, False, "Mouser", 1),
+    ]
+    assert sweep_scenarios(costing, [1, 10], nooctopart=True) == [
+        Scenario(False, False, None, 1),
+        Scenario(False, False, None, 10),
+        Scenario(False, False, "Digi-Key", 1),
+        Scenario(False, False, "Digi-Key", 10),
+        Scenario(False, False, "Mouser", 1),
+        Scenario(False, False, "Mouser", 10),
+    ]
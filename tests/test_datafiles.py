@@ -0,0 +1,102 @@
+import pytest
+
+pytest.importorskip("appdirs")
+
+from kiblast.datafiles import DataTableFile, ExtraParts, PartCatalog  # noqa: E402
+
+DEFAULTS = {
+    "REF": None,
+    "VARIANT": "COMMON",
+    "MFG": "Generic",
+    "MPN": None,
+    "FITTED": False,
+}
+
+
+def make_row(ref, variant, mfg, mpn, fitted=True, priority=0):
+    return {
+        "REF": ref,
+        "VARIANT": variant,
+        "MFG": mfg,
+        "MPN": mpn,
+        "FITTED": fitted,
+        "EXTRA": "",
+        "PRIORITY": priority,
+        "SOURCE": "COMMON",
+    }
+
+
+@pytest.fixture
+def catalog():
+    rows = [
+        make_row("R1", "COMMON", "Yageo", "RC10K"),
+        make_row("R2", "A", "Yageo", "RC1K", fitted=False),
+        make_row("R3", "COMMON", "Yageo", "RC10K", priority=1),
+        make_row("C1", "A", "Murata", "GRM1U"),
+    ]
+    return rows, PartCatalog(rows, DEFAULTS)
+
+
+def test_catalog_rows_roundtrip(catalog):
+    rows, parts = catalog
+    assert len(parts) == 4
+    assert parts.rows() == rows
+    assert parts.value(1, "FITTED") is False
+
+
+def test_catalog_where(catalog):
+    rows, parts = catalog
+    assert parts.where("VARIANT", "A") == [1, 3]
+    assert parts.where("VARIANT", "B") == []
+    assert parts.where("REF", "R3") == [2]
+    assert parts.where("FITTED", False) == [1]
+
+
+def test_catalog_lookup(catalog):
+    rows, parts = catalog
+    assert parts.lookup(("MFG", "MPN"), ("Yageo", "RC10K")) == [0, 2]
+    assert parts.lookup(("MFG", "MPN"), ("Yageo", "NOPE")) == []
+
+
+def test_catalog_group_by_and_distinct(catalog):
+    rows, parts = catalog
+    assert parts.group_by("MFG") == {"Yageo": [0, 1, 2], "Murata": [3]}
+    assert parts.group_by("PRIORITY") == {0: [0, 1, 3], 1: [2]}
+    assert parts.distinct("VARIANT") == ["COMMON", "A"]
+
+
+@pytest.fixture
+def extra_parts(tmp_path, monkeypatch):
+    monkeypatch.setattr(DataTableFile, "_DataTableFile__DATA_DIRS", [str(tmp_path)])
+    (tmp_path / "hw.parts.csv").write_text(
+        "REF,VARIANT,MFG,MPN,SIZE,EQUIVOK,FITTED,DESC\n"
+        "# A comment row\n"
+        "H1,,,M3,,,yes,common screw\n"
+        "H1,A,,M2,,,yes,variant screw\n"
+        "H2,A,,M4,,,yes,variant only\n"
+        "PCB1,,Acme,PCB-1,,,yes,board\n"
+    )
+    return ExtraParts()
+
+
+def test_get_parts_variant_takes_precedence(extra_parts):
+    parts = extra_parts.getParts("A")
+    assert [(part["REF"], part["MPN"]) for part in parts] == [
+        ("H1", "M2"),
+        ("H2", "M4"),
+        ("PCB1", "PCB-1"),
+    ]
+    assert parts[0]["SOURCE"] == "hw"
+
+
+def test_get_parts_skips_known_refs(extra_parts):
+    known_refs = ["PCB1"]
+    parts = extra_parts.getParts("COMMON", known_refs)
+    assert [part["REF"] for part in parts] == ["H1"]
+    assert known_refs == ["PCB1", "H1"]
+
+
+def test_get_extra_variants(extra_parts):
+    known_variants = ["COMMON"]
+    assert extra_parts.getExtraVariants(known_variants) == ["A"]
+    assert known_variants == ["COMMON", "A"]
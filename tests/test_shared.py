@@ -0,0 +1,184 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("appdirs")
+
+from kiblast import shared  # noqa: E402
+from kiblast.datafiles import AllData, PartCatalog  # noqa: E402
+
+pytestmark = pytest.mark.skipif(
+    not shared.available(), reason="Shared memory needs Python 3.8 or later."
+)
+
+EXTRAS_DEFAULTS = {
+    "REF": None,
+    "VARIANT": "COMMON",
+    "MFG": "Generic",
+    "MPN": None,
+    "FITTED": False,
+}
+
+
+def make_data():
+    def catalog(defaults, rows):
+        return PartCatalog(rows, defaults)
+
+    extras = [
+        {
+            "REF": "H1",
+            "VARIANT": "COMMON",
+            "MFG": "Generic",
+            "MPN": "M3",
+            "FITTED": True,
+            "EXTRA": "",
+            "PRIORITY": 0,
+            "SOURCE": "hw",
+        },
+        {
+            "REF": "H1",
+            "VARIANT": "A",
+            "MFG": "Generic",
+            "MPN": "M2",
+            "FITTED": False,
+            "EXTRA": "",
+            "PRIORITY": 1,
+            "SOURCE": "hw",
+        },
+    ]
+    stock = [
+        {
+            "MFG": "Yageo",
+            "MPN": "RC10K",
+            "QTY_ON_HAND": 0,
+            "COST": "1.5",
+            "EXTRA": "ünïcode",
+            "PRIORITY": 0,
+            "SOURCE": "mine",
+        },
+        {
+            "MFG": "Yageo",
+            "MPN": "RC1K",
+            "QTY_ON_HAND": "50",
+            "COST": None,
+            "EXTRA": "",
+            "PRIORITY": 0,
+            "SOURCE": "mine",
+        },
+    ]
+    return AllData(
+        {
+            "stock": catalog({"MFG": None, "MPN": None, "QTY_ON_HAND": 0}, stock),
+            "equivalents": catalog({"MFG": None, "MPN": None}, []),
+            "pricings": catalog({"MFG": None, "MPN": None, "LINK": None}, []),
+            "extras": catalog(EXTRAS_DEFAULTS, extras),
+        }
+    )
+
+
+def all_rows(data):
+    return {table: getattr(data, table).getAllData() for table in AllData.TABLES}
+
+
+def test_publish_attach_roundtrip():
+    data = make_data()
+    with shared.SharedData(data, prefix="kiblast_test_{}".format(os.getpid())) as sd:
+        with shared.AttachedData(sd.prefix) as attached:
+            assert all_rows(attached.data) == all_rows(data)
+            stock = attached.data.stock.getCatalog()
+            assert stock.lookup(("MFG", "MPN"), ("Yageo", "RC1K")) == [1]
+            assert stock.where("SOURCE", "mine") == [0, 1]
+            assert attached.data.extras.getDefaults() == EXTRAS_DEFAULTS
+            parts = attached.data.extras.getParts("A")
+            assert [(part["REF"], part["MPN"]) for part in parts] == [("H1", "M2")]
+
+
+WORKER = """
+import json, sys
+from kiblast.shared import AttachedData
+with AttachedData(sys.argv[1]) as attached:
+    rows = attached.data.stock.getAllData()
+print(json.dumps(rows))
+"""
+
+
+def test_attach_from_separate_processes():
+    # Each worker exiting must leave the segments for the next worker.
+    data = make_data()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    sd = shared.SharedData(data, prefix="kiblast_test_{}_p".format(os.getpid()))
+    try:
+        for worker in range(2):
+            result = subprocess.run(
+                [sys.executable, "-c", WORKER, sd.prefix],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=env,
+                universal_newlines=True,
+            )
+            assert result.returncode == 0, result.stderr
+            assert "leaked" not in result.stderr
+            assert json.loads(result.stdout) == data.stock.getAllData()
+    finally:
+        sd.unlink()
+
+
+STARTED_WORKER = """
+import multiprocessing, sys
+from kiblast import shared
+from kiblast.datafiles import AllData, PartCatalog
+
+
+def work(prefix):
+    with shared.AttachedData(prefix) as attached:
+        attached.data.stock.getAllData()
+
+
+if __name__ == "__main__":
+    data = AllData({table: PartCatalog([], {}) for table in AllData.TABLES})
+    with shared.SharedData(data, prefix=sys.argv[1]) as sd:
+        for method in sys.argv[2:]:
+            worker = multiprocessing.get_context(method).Process(
+                target=work, args=(sd.prefix,)
+            )
+            worker.start()
+            worker.join()
+            assert worker.exitcode == 0, method
+        # Still there for the next worker.
+        work(sd.prefix)
+"""
+
+
+@pytest.mark.parametrize(
+    "method",
+    [
+        method
+        for method in ["fork", "forkserver", "spawn"]
+        if method in multiprocessing.get_all_start_methods()
+    ],
+)
+def test_attach_from_started_workers(tmp_path, method):
+    # Workers started by multiprocessing share the publisher's resource tracker,
+    # which must still have the segments to unlink when they are done.
+    script = tmp_path / "publisher.py"
+    script.write_text(STARTED_WORKER)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run(
+        [
+            sys.executable,
+            str(script),
+            "kiblast_test_{}_{}".format(os.getpid(), method),
+            method,
+            method,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+        universal_newlines=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stderr == ""
@@ -0,0 +1,153 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("tomlkit")
+pytest.importorskip("lxml")
+pytest.importorskip("click")
+
+from click.testing import CliRunner  # noqa: E402
+
+from kiblast.config import KiBlastConfig  # noqa: E402
+from kiblast.datafiles import DataTableFile  # noqa: E402
+from kiblast.kiblast import main  # noqa: E402
+from kiblast.snapshot import snapshot_path  # noqa: E402
+
+SCHEMATIC = """<export version="D">
+<design><date>today</date><sheet number="1"><title_block>
+<title>Test</title><company>Test</company><rev>1</rev><date>today</date>
+</title_block></sheet></design>
+<components>
+<comp ref="R1"><value>10k</value><footprint>R:R_0402_1005Metric</footprint>
+<fields><field name="MFG">Yageo</field><field name="MPN">RC10K</field></fields></comp>
+<comp ref="R2"><value>10k</value><footprint>R:R_0402_1005Metric</footprint>
+<fields><field name="MFG">Yageo</field><field name="MPN">RC10K</field></fields></comp>
+<comp ref="C1"><value>1u</value><footprint>C:C_0402_1005Metric</footprint></comp>
+</components></export>
+"""
+
+
+@pytest.fixture
+def board(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "mine.stock.csv").write_text(
+        "MFG,MPN,SIZE,COST,COST_QTY,QTY_ON_HAND,DESCRIPTION\n"
+        "Yageo,RC10K,0402,1.00,100,5,res\n"
+    )
+    (data_dir / "LCSC.price.csv").write_text(
+        "MFG,MPN,LINK\n" "Yageo,RC10K,,1,0.10,100,0.02\n" "Generic,1u,,10,0.05\n"
+    )
+    monkeypatch.setattr(DataTableFile, "_DataTableFile__DATA_DIRS", [str(data_dir)])
+
+    cfg_file = tmp_path / "local.toml"
+    monkeypatch.setattr(KiBlastConfig, "CFG_NAMES", [(str(cfg_file), "LOCAL")])
+    monkeypatch.setattr(KiBlastConfig, "CACHE_FILE", str(tmp_path / "cache.json"))
+    monkeypatch.setattr(KiBlastConfig, "_KiBlastConfig__resolved", {})
+
+    schematic = tmp_path / "board.xml"
+    schematic.write_text(SCHEMATIC)
+    return {
+        "data_dir": data_dir,
+        "cfg_file": cfg_file,
+        "schematic": str(schematic),
+        "outfile": str(tmp_path / "board.csv"),
+    }
+
+
+def run_bom(board, *args):
+    return CliRunner().invoke(
+        main, ["bom", board["schematic"], board["outfile"]] + list(args)
+    )
+
+
+def read_bom(board):
+    with open(board["outfile"]) as f:
+        return f.read()
+
+
+def test_snapshot_written(board):
+    result = run_bom(board, "--qty", "10")
+    assert result.exit_code == 0, result.output
+
+    with open(snapshot_path(board["outfile"])) as f:
+        snapshot = json.load(f)
+    assert snapshot["scenario"]["qty"] == 10
+    assert snapshot["total"] == pytest.approx(0.05 + 1.5 + 0.5)
+    resistors = snapshot["lines"][1]
+    assert resistors["REFS"] == ["R1", "R2"]
+    assert resistors["STOCK"] == [["Yageo", "RC10K", 5, 0.01]]
+    assert resistors["BREAK"] == [1, 0.10]
+    assert resistors["BUY QTY"] == 15
+    assert sorted(snapshot["data_files"]["pricings"]["files"]) == [
+        str(board["data_dir"] / "LCSC.price.csv")
+    ]
+
+
+def test_from_snapshot_roundtrip(board, monkeypatch):
+    assert run_bom(board, "--qty", "10").exit_code == 0
+    first = read_bom(board)
+    os.remove(board["outfile"])
+
+    # Nothing may be loaded when outputting from the snapshot.
+    def no_load(*args, **kwargs):
+        raise AssertionError("data files were loaded")
+
+    monkeypatch.setattr(DataTableFile, "_load_data", no_load)
+    monkeypatch.setattr(DataTableFile, "findDataFiles", no_load)
+    result = run_bom(board, "--qty", "10", "--from-snapshot")
+    assert result.exit_code == 0, result.output
+    assert read_bom(board) == first
+
+
+def test_from_snapshot_options_must_match(board):
+    assert run_bom(board, "--qty", "10").exit_code == 0
+    result = run_bom(board, "--qty", "50", "--from-snapshot")
+    assert result.exit_code == 1
+    assert "qty : 10 (requested 50)" in result.output
+    result = run_bom(board, "--qty", "10", "--nostock", "--from-snapshot")
+    assert result.exit_code == 1
+
+
+def test_from_snapshot_missing(board):
+    result = run_bom(board, "--from-snapshot")
+    assert result.exit_code == 2
+
+
+def test_from_snapshot_infile_must_match(board):
+    assert run_bom(board).exit_code == 0
+    with open(board["schematic"], "a") as f:
+        f.write("\n")
+    result = run_bom(board, "--from-snapshot")
+    assert result.exit_code == 1
+    assert "different INFILE" in result.output
+
+
+@pytest.mark.parametrize("change", ["added", "removed", "changed", "config"])
+def test_from_snapshot_stale(board, change):
+    assert run_bom(board).exit_code == 0
+
+    if change == "added":
+        (board["data_dir"] / "zz.price.csv").write_text("Yageo,RC10K,,1,0.001\n")
+    elif change == "removed":
+        os.remove(str(board["data_dir"] / "mine.stock.csv"))
+    elif change == "changed":
+        with open(str(board["data_dir"] / "LCSC.price.csv"), "a") as f:
+            f.write("Yageo,RC10K,,1,0.01\n")
+    else:
+        board["cfg_file"].write_text('[kicad]\nmfg_field = "MANUFACTURER"\n')
+
+    # The frozen BOM is still output, unless it is checked.
+    result = run_bom(board, "--from-snapshot")
+    assert result.exit_code == 0, result.output
+    result = run_bom(board, "--from-snapshot", "--check-stale")
+    assert result.exit_code == 1
+    assert "is stale" in result.output
+
+
+def test_xlsx_not_supported(board):
+    board["outfile"] = board["outfile"][:-4] + ".xlsx"
+    result = run_bom(board)
+    assert result.exit_code == 2
+    assert not os.path.exists(board["outfile"])